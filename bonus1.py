@@ -1,19 +1,20 @@
 import arcpy
 import arcpy.management
+import math
 import os
 import re  # Added for regular expression cleaning
-from geopy.distance import geodesic
+from functools import lru_cache
+import numpy as np
 
-from core import read_all_csvs
-from consts import WORKSPACE
+from core import SportFacility, read_all_csvs, facilities_to_feature_class, njit, prange
+from consts import HK1980GRID, WORKSPACE
 
 # Set ArcGIS workspace
 arcpy.env.workspace = WORKSPACE
 arcpy.env.overwriteOutput = True  # Allow overwriting existing files
 
 # Set coordinate system to Hong Kong 1980 Grid (EPSG:2326)
-SPATIAL_REFERENCE = arcpy.SpatialReference(2326)
-arcpy.env.outputCoordinateSystem = SPATIAL_REFERENCE
+arcpy.env.outputCoordinateSystem = HK1980GRID
 
 # PolyU coordinates (latitude, longitude)
 POLYU_LAT = 22.301612
@@ -22,7 +23,69 @@ POLYU_LON = 114.184546
 # Walkable distance threshold in kilometers
 WALKABLE_DISTANCE_KM = 1.0  # Adjust as needed (e.g., 0.5 km for a shorter range)
 
-def filter_facilities_by_type_and_distance(sports_data, lat, lon, distance_km):
+# Mean earth radius in kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+# Characters which are invalid in a feature class name
+INVALID_FC_CHARS = re.compile(r'[^a-zA-Z0-9]+')
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def walk_mask(lats, lons, lat0, lon0, radius_km, distance_km):
+        """
+        Mask the points within the distance from (lat0, lon0), using the equirectangular approximation.
+        Compiled by numba into a parallel loop over the points.
+        """
+        cos_lat0 = math.cos(math.radians(lat0))
+        max_angle_sq = (distance_km / radius_km) ** 2
+        mask = np.empty(lats.shape[0], dtype=np.bool_)
+        for i in prange(lats.shape[0]):
+            dlat = math.radians(lats[i] - lat0)
+            dlon = math.radians(lons[i] - lon0) * cos_lat0
+            mask[i] = dlat * dlat + dlon * dlon <= max_angle_sq
+        return mask
+else:
+    def walk_mask(lats, lons, lat0, lon0, radius_km, distance_km):
+        """
+        Mask the points within the distance from (lat0, lon0), using the equirectangular approximation.
+        """
+        cos_lat0 = math.cos(math.radians(lat0))
+        dlat = np.radians(lats - lat0)
+        dlon = np.radians(lons - lon0) * cos_lat0
+        return dlat * dlat + dlon * dlon <= (distance_km / radius_km) ** 2
+
+@lru_cache(maxsize=None)
+def wgs84_geod():
+    """
+    Ellipsoid for accurate geodesic distances. pyproj is only imported when the geodesic mode is used.
+    """
+    from pyproj import Geod
+    return Geod(ellps="WGS84")
+
+@lru_cache(maxsize=None)
+def facility_type_of(dataset):
+    """
+    Extract and format facility type from dataset. Cached as there are only a few datasets.
+    """
+    return dataset.replace(".csv", "").replace("_", " ").title()
+
+def build_facility_tree(sports_data):
+    """
+    Build a spatial index over the facility coordinates, which can be reused across reference points.
+
+    Args:
+        sports_data (list): List of SportFacility objects from CSV files.
+
+    Returns:
+        STRtree: R-tree of the facility (lon, lat) points, in the same order as sports_data.
+    """
+    # shapely is only needed for the optional spatial index
+    import shapely
+
+    table = SportFacility.table(sports_data)
+    return shapely.STRtree(shapely.points(table["lon"], table["lat"]))
+
+def filter_facilities_by_type_and_distance(sports_data, lat, lon, distance_km, tree=None, geodesic=False):
     """
     Filter facilities by type and within a specified distance from a reference point.
 
@@ -31,21 +94,46 @@ def filter_facilities_by_type_and_distance(sports_data, lat, lon, distance_km):
         lat (float): Latitude of the reference point (e.g., PolyU).
         lon (float): Longitude of the reference point (e.g., PolyU).
         distance_km (float): Distance threshold in kilometers.
+        tree (STRtree): Optional index from build_facility_tree to prefilter the facilities.
+        geodesic (bool): Use the geodesic distance on the WGS84 ellipsoid instead of the approximation.
 
     Returns:
         dict: Dictionary with facility types as keys and lists of facilities as values.
     """
+    # Bounding box of the walkable circle, with a 1% margin for the ellipsoid
+    dlat_deg = math.degrees(distance_km / EARTH_RADIUS_KM) * 1.01
+    dlon_deg = dlat_deg / math.cos(math.radians(lat))
+    if tree is None:
+        # Reject the facilities outside the bounding box before computing any distance
+        table = SportFacility.table(sports_data)
+        in_bbox = (np.abs(table["lat"] - lat) <= dlat_deg) & (np.abs(table["lon"] - lon) <= dlon_deg)
+        candidates = np.flatnonzero(in_bbox)
+        lats, lons = table["lat"][candidates], table["lon"][candidates]
+    else:
+        # Only keep the facilities within the bounding box of the walkable circle
+        import shapely
+        bbox = shapely.box(lon - dlon_deg, lat - dlat_deg, lon + dlon_deg, lat + dlat_deg)
+        candidates = np.sort(tree.query(bbox))
+        table = SportFacility.table([sports_data[i] for i in candidates])
+        lats, lons = table["lat"], table["lon"]
+
+    if geodesic:
+        # Solve all the geodesics in one call to PROJ
+        _, _, distances_m = wgs84_geod().inv(lons, lats, np.full_like(lons, lon), np.full_like(lats, lat))
+        within = distances_m <= distance_km * 1000
+    else:
+        # Equirectangular approximation: the earth is locally flat within walkable distance,
+        # so compare the squared angular distances without any trigonometry or sqrt per facility
+        within = walk_mask(lats, lons, lat, lon, EARTH_RADIUS_KM, distance_km)
+
     filtered_by_type = {}
-    for facility in sports_data:
-        facility_coords = (facility.lat, facility.lon)
-        polyu_coords = (lat, lon)
-        distance = geodesic(facility_coords, polyu_coords).kilometers
-        if distance <= distance_km:
-            # Extract and format facility type from dataset
-            facility_type = facility.dataset.replace(".csv", "").replace("_", " ").title()
-            if facility_type not in filtered_by_type:
-                filtered_by_type[facility_type] = []
-            filtered_by_type[facility_type].append(facility)
+    # Only iterate the facilities within the distance
+    for index in candidates[within]:
+        facility = sports_data[index]
+        facility_type = facility_type_of(facility.dataset)
+        if facility_type not in filtered_by_type:
+            filtered_by_type[facility_type] = []
+        filtered_by_type[facility_type].append(facility)
     return filtered_by_type
 
 def create_feature_class_for_type(facility_type, filtered_data, output_fc_name):
@@ -61,20 +149,10 @@ def create_feature_class_for_type(facility_type, filtered_data, output_fc_name):
         str: Path to the created feature class.
     """
     try:
-        # Create a new point feature class
-        output_fc = arcpy.management.CreateFeatureclass(
-            WORKSPACE, output_fc_name, "POINT", spatial_reference=SPATIAL_REFERENCE
+        # Load the points and facility attributes into a new feature class in one go
+        output_fc = facilities_to_feature_class(
+            filtered_data, facility_type, os.path.join(WORKSPACE, output_fc_name), HK1980GRID
         )
-        # Add fields for facility attributes
-        arcpy.management.AddField(output_fc, "Facility_Type", "TEXT", field_length=50)
-        arcpy.management.AddField(output_fc, "Fac_Name", "TEXT", field_length=100)
-        arcpy.management.AddField(output_fc, "District", "TEXT", field_length=50)
-        # Insert data into the feature class
-        with arcpy.da.InsertCursor(output_fc, ["SHAPE@", "Facility_Type", "Fac_Name", "District"]) as cursor:
-            for facility in filtered_data:
-                point = arcpy.Point(facility.easting, facility.northing)
-                point_geom = arcpy.PointGeometry(point, SPATIAL_REFERENCE)
-                cursor.insertRow([point_geom, facility_type, facility.fac_name, facility.district])
         print(f"Feature class '{output_fc}' for '{facility_type}' created successfully.")
         return output_fc
     except arcpy.ExecuteError:
@@ -104,7 +182,7 @@ def main():
         # Step 3: Create a feature class for each facility type
         for facility_type, facilities in filtered_by_type.items():
             # Clean facility_type for feature class name to remove invalid characters
-            fc_name_clean = re.sub(r'[^a-zA-Z0-9]+', '_', facility_type)
+            fc_name_clean = INVALID_FC_CHARS.sub('_', facility_type)
             output_fc_name = f"{fc_name_clean}_Near_PolyU"
             create_feature_class_for_type(facility_type, facilities, output_fc_name)
     except Exception as e:
@@ -2,14 +2,14 @@ import arcpy
 import arcpy.management
 import arcpy.sa
 import os
+from math import pi, sqrt
 
 from core import exception_handler
-from consts import WORKSPACE
+from consts import HK1980GRID, WORKSPACE
 
 # Set the workspace to the root directory
 arcpy.env.workspace = WORKSPACE
 arcpy.env.overwriteOutput = True
-HK1980GRID = arcpy.SpatialReference(2326)
 arcpy.env.outputCoordinateSystem = HK1980GRID
 
 HKDTM_ASC = os.path.abspath("./HKDTM/DTM.ASC")
@@ -50,13 +50,16 @@ def four_facilities_with_flat_land():
     output_suitable_areas = "FlatArea"
     facilities_fc = "facilities_list"
 
-    neighborhood = arcpy.sa.NbrCircle(500, "MAP")  # 500m radius circle
-    elevation_std = arcpy.sa.FocalStatistics(
-        land_raster,
-        neighborhood,
-        "STD",
-        "DATA"
-    )
+    # Square with the same area as a 500m radius circle, rectangle moving averages are much cheaper
+    side = 500 * sqrt(pi)
+    neighborhood = arcpy.sa.NbrRectangle(side, side, "MAP")
+
+    # Step 1: Compute the std from the moving averages, std = sqrt(E[X^2] - E[X]^2)
+    elevation_mean = arcpy.sa.FocalStatistics(land_raster, neighborhood, "MEAN", "DATA")
+    elevation_sq_mean = arcpy.sa.FocalStatistics(arcpy.sa.Square(land_raster), neighborhood, "MEAN", "DATA")
+    elevation_var = elevation_sq_mean - arcpy.sa.Square(elevation_mean)
+    # Clamp the negative rounding errors on flat land
+    elevation_std = arcpy.sa.SquareRoot(arcpy.sa.Con(elevation_var > 0, elevation_var, 0))
 
     # Step 2: Identify low-variation areas (e.g., std < 2 meters)
     low_variation = arcpy.sa.Con(elevation_std < 20, 1, 0)
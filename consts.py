@@ -1,3 +1,5 @@
+import arcpy
+
 FileNames = [
     "Badminton_court.csv",
     "Basketball_court.csv",
@@ -22,3 +24,6 @@ FacilityTypes = [
 
 # Define ArcGIS workspace (update this to your actual geodatabase path)
 WORKSPACE = "./Waterdragen.gdb"
+
+# Hong Kong 1980 Grid (EPSG:2326), constructed once and shared by all the modules
+HK1980GRID = arcpy.SpatialReference(2326)
@@ -1,22 +1,28 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 import arcpy
+import numpy as np
+import pandas as pd
 
 from consts import FileNames
-import csv
 import os
 
-
-def check_na_or_empty(s: str, default):
-    if s == "" or s == "N.A.":
-        return default
-    return s
+# numba is optional, the kernels fall back to NumPy when it is not installed
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
 
 
 @dataclass
 class SportFacility:
+    # dataclass(slots=True) needs Python 3.10, ArcGIS Pro 3.0-3.2 ship Python 3.9
+    __slots__ = ("gmid", "dataset", "fac_name", "addr", "district", "northing", "easting", "lat", "lon")
+
     gmid: str
     dataset: str
     fac_name: str
@@ -28,18 +34,31 @@ class SportFacility:
     lon: float
 
     @classmethod
-    def from_csv_row(cls, csv_row: list[str]):
-        return cls(
-            csv_row[0],
-            csv_row[1],
-            csv_row[2],
-            check_na_or_empty(csv_row[3], None),
-            check_na_or_empty(csv_row[4], None),
-            float(csv_row[5]),
-            float(csv_row[6]),
-            float(csv_row[7]),
-            float(csv_row[8]),
-        )
+    def table(cls, facilities: list[SportFacility]) -> dict[str, np.ndarray]:
+        """
+        :param facilities: a list of SportFacility
+        :return: the coordinate fields as contiguous float64 arrays, keyed by the field name
+        """
+        return {
+            field: np.fromiter((getattr(f, field) for f in facilities), dtype=np.float64, count=len(facilities))
+            for field in ("northing", "easting", "lat", "lon")
+        }
+
+
+CSV_COLUMNS = ["gmid", "dataset", "fac_name", "addr", "district", "northing", "easting", "lat", "lon"]
+CSV_DTYPES = {
+    "gmid": str,
+    "dataset": str,
+    "fac_name": str,
+    "addr": str,
+    "district": str,
+    "northing": np.float64,
+    "easting": np.float64,
+    "lat": np.float64,
+    "lon": np.float64,
+}
+# Only the address and the district can be missing
+CSV_NA_VALUES = {"addr": ["", "N.A."], "district": ["", "N.A."]}
 
 
 def read_all_csvs(folder: str) -> list[SportFacility]:
@@ -47,10 +66,7 @@ def read_all_csvs(folder: str) -> list[SportFacility]:
     :param folder: folder containing the csv files
     :return: a list merging all the csv files in the directory
     """
-    table = []
-    for filename in FileNames:
-        table.extend(read_csv(os.path.join(folder, filename)))
-    return table
+    return facilities_from_df(read_all_csvs_df(folder))
 
 
 def read_csv(filename) -> list[SportFacility]:
@@ -58,10 +74,93 @@ def read_csv(filename) -> list[SportFacility]:
     :param filename: path to the csv
     :return: a list of csv rows
     """
-    with open(filename, encoding='utf-8') as f:
-        csv_reader = csv.reader(f)
-        next(csv_reader)  # skip the header
-        return [SportFacility.from_csv_row(row) for row in csv_reader]
+    return facilities_from_df(read_csv_df(filename))
+
+
+def read_all_csvs_df(folder: str) -> pd.DataFrame:
+    """
+    :param folder: folder containing the csv files
+    :return: a DataFrame merging all the csv files in the directory, one column per SportFacility field
+    """
+    # The C parser releases the GIL, so the files can be parsed in parallel threads
+    with ThreadPoolExecutor() as executor:
+        dfs = list(executor.map(read_csv_df, [os.path.join(folder, filename) for filename in FileNames]))
+    return pd.concat(dfs, ignore_index=True)
+
+
+def read_csv_df(filename) -> pd.DataFrame:
+    """
+    :param filename: path to the csv
+    :return: a DataFrame of the csv rows, parsed and converted by pandas
+    """
+    # Every field is parsed by the C engine with its own dtype and missing values
+    return pd.read_csv(
+        filename,
+        engine='c',
+        float_precision='round_trip',  # parse the coordinates exactly like float()
+        encoding='utf-8',
+        header=0,  # replace the header with the SportFacility field names
+        names=CSV_COLUMNS,
+        usecols=range(len(CSV_COLUMNS)),
+        dtype=CSV_DTYPES,
+        keep_default_na=False,
+        na_values=CSV_NA_VALUES,
+    )
+
+
+def facilities_from_df(df: pd.DataFrame) -> list[SportFacility]:
+    """
+    :param df: a DataFrame from read_csv_df or read_all_csvs_df
+    :return: a list of SportFacility, one per DataFrame row
+    """
+    # Store the missing addresses and districts as None instead of NaN
+    df = df.astype(object).where(df.notna(), None)
+    return [SportFacility(*row) for row in df.itertuples(index=False, name=None)]
+
+
+FACILITY_POINT_DTYPE = np.dtype([
+    ("XY", "<f8", 2),
+    ("Facility_Type", "U50"),
+    ("Fac_Name", "U100"),
+    ("District", "U50"),
+])
+
+
+def facilities_to_feature_class(facilities: list[SportFacility], facility_types, output_fc: str,
+                                spatial_reference) -> str:
+    """
+    Bulk load the facilities into a new point feature class in a single call
+    :param facilities: a list of SportFacility
+    :param facility_types: the Facility_Type of each facility, or a single Facility_Type for all of them
+    :param output_fc: path to the output feature class, overwritten if it exists
+    :param spatial_reference: the spatial reference of the easting and northing
+    :return: path to the created feature class
+    """
+    table = SportFacility.table(facilities)
+    array = np.empty(len(facilities), dtype=FACILITY_POINT_DTYPE)
+    array["XY"][:, 0] = table["easting"]
+    array["XY"][:, 1] = table["northing"]
+    array["Facility_Type"] = facility_types
+    array["Fac_Name"] = [f.fac_name for f in facilities]
+    # Text columns in a numpy array cannot hold nulls, store missing districts as empty strings
+    array["District"] = [f.district or "" for f in facilities]
+
+    return array_to_feature_class(array, output_fc, spatial_reference)
+
+
+def array_to_feature_class(array: np.ndarray, output_fc: str, spatial_reference) -> str:
+    """
+    Write a structured array with an XY point column into a new point feature class
+    :param array: a structured array, one field per attribute plus the "XY" coordinates
+    :param output_fc: path to the output feature class, overwritten if it exists
+    :param spatial_reference: the spatial reference of the XY coordinates
+    :return: path to the created feature class
+    """
+    # NumPyArrayToFeatureClass does not respect env.overwriteOutput
+    if arcpy.Exists(output_fc):
+        arcpy.management.Delete(output_fc)
+    arcpy.da.NumPyArrayToFeatureClass(array, output_fc, ["XY"], spatial_reference)
+    return output_fc
 
 
 def exception_handler(f):
@@ -5,8 +5,8 @@ from arcpy.sa import PointDensity, NbrCircle
 import os
 from math import pi, sqrt
 
-from core import read_all_csvs, exception_handler
-from consts import FileNames, WORKSPACE
+from core import read_all_csvs, exception_handler, facilities_to_feature_class
+from consts import FileNames, HK1980GRID, WORKSPACE
 
 if not os.path.exists(WORKSPACE):
     arcpy.CreateFileGDB_management("./", WORKSPACE)
@@ -16,8 +16,7 @@ env.workspace = WORKSPACE
 env.overwriteOutput = True  # Allow overwriting existing files
 
 # Set coordinate system to Hong Kong 1980 Grid (EPSG:2326)
-SPATIAL_REFERENCE = arcpy.SpatialReference(2326)
-env.outputCoordinateSystem = SPATIAL_REFERENCE
+env.outputCoordinateSystem = HK1980GRID
 
 
 @exception_handler
@@ -32,30 +31,20 @@ def create_feature_class(sports_data, output_fc_name):
         Path to the created feature class
     """
 
-    # Create a new point feature class
-    output_fc = arcpy.management.CreateFeatureclass(
-        WORKSPACE, output_fc_name, "POINT", spatial_reference=SPATIAL_REFERENCE
-    )
-
-    # Add fields for facility attributes
-    arcpy.management.AddField(output_fc, "Facility_Type", "TEXT", field_length=50)
-    arcpy.management.AddField(output_fc, "Fac_Name", "TEXT", field_length=100)
-    arcpy.management.AddField(output_fc, "District", "TEXT", field_length=50)
-
-    # Insert data into the feature class
+    # Validate coordinates
+    valid_facilities = []
+    for facility in sports_data:
+        if not (facility.easting and facility.northing):
+            print(f"Warning: Skipping {facility.fac_name} due to missing coordinates.")
+            continue
+        valid_facilities.append(facility)
 
-    with arcpy.da.InsertCursor(output_fc, ["SHAPE@", "Facility_Type", "Fac_Name", "District"]) as cursor:
-        for facility in sports_data:
-            # Validate coordinates
-            if not (facility.easting and facility.northing):
-                print(f"Warning: Skipping {facility.fac_name} due to missing coordinates.")
-                continue
+    facility_types = [facility.dataset.replace("_", " ").title() for facility in valid_facilities]
 
-            point = arcpy.Point(float(facility.easting), float(facility.northing))
-            point_geom = arcpy.PointGeometry(point, SPATIAL_REFERENCE)
-
-            facility_type = facility.dataset.replace("_", " ").title()
-            cursor.insertRow([point_geom, facility_type, facility.fac_name, facility.district])
+    # Load the points and facility attributes into a new feature class in one go
+    output_fc = facilities_to_feature_class(
+        valid_facilities, facility_types, os.path.join(WORKSPACE, output_fc_name), HK1980GRID
+    )
 
     print(f"Feature class '{output_fc}' created successfully.")
 
@@ -4,7 +4,7 @@ from arcpy import management
 from arcpy import env
 import os
 from core import read_all_csvs, exception_handler
-from consts import WORKSPACE
+from consts import HK1980GRID, WORKSPACE
 from question1 import create_feature_class
 
 # Set ArcGIS workspace
@@ -12,8 +12,7 @@ env.workspace = WORKSPACE
 env.overwriteOutput = True  # Allow overwriting existing files
 
 # Set coordinate system to Hong Kong 1980 Grid (EPSG:2326)
-SPATIAL_REFERENCE = arcpy.SpatialReference(2326)
-env.outputCoordinateSystem = SPATIAL_REFERENCE
+env.outputCoordinateSystem = HK1980GRID
 
 # Path to the district shapefile
 district_shp = os.path.abspath("./Hong_Kong_18_Districts/HKDistrict18.shp")
@@ -33,7 +32,7 @@ def create_buffer(input_fc, buffer_distance, output_fc, dissolve_option="ALL"):
     """
     try:
         output_buffer = os.path.join(WORKSPACE, output_fc)
-        arcpy.analysis.Buffer(input_fc, output_buffer, buffer_distance, dissolve_option=dissolve_option)
+        arcpy.analysis.PairwiseBuffer(input_fc, output_buffer, buffer_distance, dissolve_option=dissolve_option)
         print(f"Buffer created: '{output_buffer}' with distance {buffer_distance}")
         return output_buffer
     except arcpy.ExecuteError:
@@ -44,6 +43,25 @@ def create_buffer(input_fc, buffer_distance, output_fc, dissolve_option="ALL"):
         raise
 
 
+def calculate_coverage(intersect_fc, coverage_field, district_fc, district_fid_field):
+    """
+    Calculate the percentage of each district covered by the intersected buffers.
+
+    Args:
+        intersect_fc: Feature class of the buffers intersected with the districts
+        coverage_field: Name of the field to store the coverage percentage
+        district_fc: Feature class with district boundaries
+        district_fid_field: Field in intersect_fc with the OID of the district
+    """
+    # Join the district areas by OID, the joined field is renamed to avoid clashing with Shape_Area
+    district_oid_field = arcpy.Describe(district_fc).OIDFieldName
+    arcpy.management.JoinField(intersect_fc, district_fid_field, district_fc, district_oid_field, ["Shape_Area"])
+
+    # The features are in the projected HK 1980 Grid, so the planar area is already the mapped area
+    arcpy.management.CalculateField(intersect_fc, coverage_field, "!Shape_Area! / !Shape_Area_1! * 100", "PYTHON3")
+    arcpy.management.DeleteField(intersect_fc, "Shape_Area_1")
+
+
 @exception_handler
 def analyze_coverage(facility_fc, district_fc, facility_type, walk_distance, user_distance):
     """
@@ -73,37 +91,22 @@ def analyze_coverage(facility_fc, district_fc, facility_type, walk_distance, use
     user_buffer = create_buffer(facility_fc, f"{user_distance} Meters",
                                 f"{facility_type.replace(' ', '_')}_User_Buffer")
 
-    # Intersect buffers with districts
+    # Intersect buffers with districts, the pairwise tools run in parallel internally
     walk_intersect = os.path.join(WORKSPACE, f"{facility_type.replace(' ', '_')}_Walk_Intersect")
     user_intersect = os.path.join(WORKSPACE, f"{facility_type.replace(' ', '_')}_User_Intersect")
-    arcpy.analysis.Intersect([walk_buffer, district_fc], walk_intersect)
-    arcpy.analysis.Intersect([user_buffer, district_fc], user_intersect)
+    arcpy.analysis.PairwiseIntersect([walk_buffer, district_fc], walk_intersect)
+    arcpy.analysis.PairwiseIntersect([user_buffer, district_fc], user_intersect)
 
-    # Calculate coverage percentage using ENAME and SHAPE_Area
+    # Calculate coverage percentage using the district OID and SHAPE_Area
     arcpy.management.AddField(walk_intersect, "Walk_Coverage_Pct", "DOUBLE")
     arcpy.management.AddField(user_intersect, "User_Coverage_Pct", "DOUBLE")
 
-    # Store original district areas in a dictionary for efficiency
-    district_areas = {}
-    with arcpy.da.SearchCursor(district_fc, ["ENAME", "SHAPE_Area"]) as cursor:
-        for row in cursor:
-            district_areas[row[0]] = row[1]
-
-    # Calculate coverage areas and percentages for walk buffer
-    with arcpy.da.UpdateCursor(walk_intersect, ["SHAPE@", "Walk_Coverage_Pct", "ENAME"]) as cursor:
-        for row in cursor:
-            area = row[0].getArea("GEODESIC", "SQUAREMETERS")
-            if row[2] in district_areas:
-                row[1] = (area / district_areas[row[2]]) * 100
-                cursor.updateRow(row)
-
-    # Calculate coverage areas and percentages for user buffer
-    with arcpy.da.UpdateCursor(user_intersect, ["SHAPE@", "User_Coverage_Pct", "ENAME"]) as cursor:
-        for row in cursor:
-            area = row[0].getArea("GEODESIC", "SQUAREMETERS")
-            if row[2] in district_areas:
-                row[1] = (area / district_areas[row[2]]) * 100
-                cursor.updateRow(row)
+    # Intersect keeps the OID of the district in the FID_<district feature class> field
+    district_fid_field = f"FID_{os.path.basename(district_fc)}"
+
+    # Calculate coverage areas and percentages for walk and user buffers
+    calculate_coverage(walk_intersect, "Walk_Coverage_Pct", district_fc, district_fid_field)
+    calculate_coverage(user_intersect, "User_Coverage_Pct", district_fc, district_fid_field)
 
     print(f"Coverage analysis completed for '{facility_type}'.")
     print(f"Walking distance ({walk_distance} m) results: {walk_intersect}")
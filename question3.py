@@ -1,14 +1,15 @@
-import multiprocessing as mp
 import os
 from itertools import combinations
-import shutil
 
 import arcpy
+import arcpy.analysis
 import arcpy.conversion
 import arcpy.management
+import numpy as np
+import shapely
 
-from consts import FacilityTypes, WORKSPACE
-from core import read_all_csvs, exception_handler, replace_special_chars
+from consts import FacilityTypes, HK1980GRID, WORKSPACE
+from core import read_all_csvs, exception_handler
 
 try:
     arcpy.CreateFileGDB_management("./", WORKSPACE)
@@ -20,80 +21,74 @@ arcpy.env.overwriteOutput = True
 geo_feature_counter = 0
 
 # Set coordinate system to Hong Kong 1980 Grid (EPSG:2326)
-HK1980GRID = arcpy.SpatialReference(2326)
 arcpy.env.outputCoordinateSystem = HK1980GRID
 
-if not os.path.exists("./shape"):
-    os.makedirs("./shape")
-
-def make_fac_type_layer(feature_class, facility_type):
-    # Create a new feature layer for the current facility type
-    fac_type_name = f"{replace_special_chars(facility_type)}_Layer"
-    fac_type_layer = arcpy.management.SelectLayerByAttribute(
-        feature_class, "NEW_SELECTION",
-        f"Facility_Type = '{facility_type}'"
-    )
-    count = int(arcpy.GetCount_management(fac_type_layer)[0])
-    print(f"Selected {count} features for Facility_Type = '{facility_type}'")
+def intersect_three_types(buffer_fc):
+    """
+    Find the areas covered by the buffers of at least 3 different facility types.
 
-    print(f"Created layer {fac_type_name}")
-    arcpy.CopyFeatures_management(fac_type_layer, f"./shape/{fac_type_name}.shp")
+    Args:
+        buffer_fc: Feature class with the facility buffers and their Facility_Type
+    Returns:
+        The shapely geometry of the areas, or None if there are no such areas
+    """
+    type_codes = {fac_type: code for code, fac_type in enumerate(FacilityTypes)}
+    wkbs = []
+    types = []
+    with arcpy.da.SearchCursor(buffer_fc, ["SHAPE@WKB", "Facility_Type"]) as cursor:
+        for wkb, fac_type in cursor:
+            if fac_type in type_codes:
+                wkbs.append(bytes(wkb))
+                types.append(type_codes[fac_type])
+
+    buffers = shapely.from_wkb(wkbs)
+    types = np.array(types)
+
+    # Dissolve the buffers of each type first, so only the 56 combinations of 3 types are intersected
+    per_type = [shapely.union_all(buffers[types == code]) for code in range(len(FacilityTypes))]
+    pieces = [
+        shapely.intersection(shapely.intersection(per_type[a], per_type[b]), per_type[c])
+        for a, b, c in combinations(range(len(per_type)), 3)
+    ]
+
+    # Drop the empty intersections and the ones that only touch
+    pieces = np.array(pieces, dtype=object)
+    pieces = pieces[shapely.area(pieces) > 0]
+    if len(pieces) == 0:
+        return None
+    return shapely.union_all(pieces)
 
 
 @exception_handler
 def three_or_above_facilities(radius: float = 500.0, facilities_list="facilities_list"):
-    facilities_buffer = "facilities_buffer"
+    # The buffers are only read back once, keep them in memory instead of the geodatabase
+    facilities_buffer = r"memory\facilities_buffer"
     three_type_fac_intersect = "ThreeTypeIntersect"
     hk_shape = "./Hong_Kong_18_Districts/HKDistrict18.shp"
-    arcpy.Buffer_analysis(facilities_list, facilities_buffer, f"{radius} Meters")
-
-    for fac_type in FacilityTypes:
-        make_fac_type_layer(facilities_buffer, fac_type)
-
-    # Use multiprocessing for each combination of 3 for the intersection
-    with mp.Pool() as pool:
-        results = [pool.apply_async(process_combination,
-                                    args=(index, fac_type_comb))
-                   for index, fac_type_comb
-                   in enumerate(combinations(FacilityTypes, 3))]
-        fac_intersect_list = [res.get() for res in results]
-
-    # Combine the interecting shapes
-    arcpy.management.Merge(fac_intersect_list, three_type_fac_intersect)
-    arcpy.Clip_analysis(three_type_fac_intersect, hk_shape)
-
-    # Remove the produced shapes
-    shutil.rmtree("./shape/")
-
-    # Dissolve all the shapes into one shape
-    temp_name = three_type_fac_intersect + "_temp"
-    arcpy.Dissolve_management(three_type_fac_intersect, temp_name)
-    arcpy.Delete_management(three_type_fac_intersect)
-    arcpy.Rename_management(temp_name, three_type_fac_intersect)
-
-    arcpy.MultipartToSinglepart_management(three_type_fac_intersect, temp_name)
-    arcpy.Delete_management(three_type_fac_intersect)
-    arcpy.Rename_management(temp_name, three_type_fac_intersect)
+    # The pairwise tools run in parallel internally
+    arcpy.analysis.PairwiseBuffer(facilities_list, facilities_buffer, f"{radius} Meters")
+
+    # Intersect the buffers of every combination of 3 types, the shapes are already dissolved into one
+    three_type_area = intersect_three_types(facilities_buffer)
+    arcpy.Delete_management(facilities_buffer)
+    if three_type_area is None:
+        print("No areas are covered by three or more facility types")
+        return
+
+    # Chain the intermediate outputs in memory, only the final shapes are written to the geodatabase
+    merged = r"memory\three_type_merged"
+    clipped = r"memory\three_type_clipped"
+    geom = arcpy.FromWKB(bytearray(shapely.to_wkb(three_type_area)), HK1980GRID)
+    arcpy.CopyFeatures_management([geom], merged)
+    arcpy.Clip_analysis(merged, hk_shape, clipped)
+    arcpy.MultipartToSinglepart_management(clipped, three_type_fac_intersect)
+
+    arcpy.Delete_management(merged)
+    arcpy.Delete_management(clipped)
 
     print(f"Successfully saved to {three_type_fac_intersect}")
 
 
-def process_combination(index, fac_type_comb):
-    fac_type_layers = []
-    for fac_type in fac_type_comb:
-        fac_type_name = f"./shape/{replace_special_chars(fac_type)}_Layer.shp"
-        assert arcpy.Exists(fac_type_name), fac_type_name
-        fac_type_layers.append(fac_type_name)
-
-    out_name = f"./shape/FeatureCombination_{index}.shp"
-    try:
-        arcpy.Intersect_analysis(fac_type_layers, out_name, "ONLY_FID")
-    except Exception as e:
-        print(e)
-        print(f"Warning: {out_name} is ignored")
-    return out_name
-
-
 @exception_handler
 def main():
     """
@@ -6,79 +6,121 @@ from __future__ import annotations
 import arcpy
 import arcpy.conversion
 import arcpy.management
+import numpy as np
 import os
+import pandas as pd
+import shapely
+import sys
+from functools import cached_property
+from scipy.spatial import cKDTree
 
-from core import SportFacility, read_all_csvs
-from consts import WORKSPACE
-from collections import Counter
-from math import sqrt
+from core import SportFacility, read_all_csvs_df, facilities_from_df, array_to_feature_class, njit, prange
+from consts import HK1980GRID, WORKSPACE
 
-HK1980GRID = arcpy.SpatialReference(2326)
 arcpy.env.outputCoordinateSystem = HK1980GRID
 arcpy.env.overwriteOutput = True
+# Compressed, tiled raster outputs without pyramids
+arcpy.env.compression = "LZ77"
+arcpy.env.pyramid = "NONE"
+arcpy.env.tileSize = "256 256"
 
 HK_DISTRICT_18 = os.path.abspath("./Hong_Kong_18_Districts/HKDistrict18.shp")
 SQM_TO_SQKM = 1_000_000
 
+FACILITY_DTYPE = np.dtype([
+    ("XY", "<f8", 2),
+    ("GMID", "U255"),
+    ("Dataset", "U255"),
+    ("FacilityName", "U255"),
+    ("Address", "U255"),
+    ("District", "U255"),
+    ("Northing", "<f8"),
+    ("Easting", "<f8"),
+    ("Latitude", "<f8"),
+    ("Longitude", "<f8"),
+])
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _within_radius(n_arr, e_arr, n0, e0, radius):
+        """
+        Mask the points whose distance from (n0, e0) is less than the radius.
+        Compiled by numba into a parallel loop over the points.
+        """
+        r2 = radius * radius
+        out = np.empty(n_arr.shape[0], dtype=np.bool_)
+        for i in prange(n_arr.shape[0]):
+            # Reject the points outside the bounding box of the circle first
+            dn = n_arr[i] - n0
+            de = e_arr[i] - e0
+            if dn >= radius or dn <= -radius or de >= radius or de <= -radius:
+                out[i] = False
+            else:
+                out[i] = dn * dn + de * de < r2
+        return out
+else:
+    def _within_radius(n_arr, e_arr, n0, e0, radius):
+        """
+        Mask the points whose distance from (n0, e0) is less than the radius.
+        """
+        return (n_arr - n0) ** 2 + (e_arr - e0) ** 2 < radius * radius
+
+
+# The workspace last set by _set_ws, to skip the redundant arcpy.env writes
+_CURRENT_WS = None
+
+
+def _set_ws(workspace):
+    global _CURRENT_WS
+    if _CURRENT_WS != workspace:
+        arcpy.env.workspace = workspace
+        _CURRENT_WS = workspace
+
 
 class FacilityFeature:
     def __init__(self, workspace, csv_folder: str, feature_name: str):
         # Store the workspace for processing data
         self.workspace = workspace
-        arcpy.env.workspace = self.workspace
-        arcpy.env.overwriteOutput = True
-        arcpy.CreateFileGDB_management("./", workspace)
+        _set_ws(self.workspace)
+        if not arcpy.Exists(workspace):
+            arcpy.management.CreateFileGDB("./", workspace)
 
         # Storages for facility and population data
-        self.fac_list: list[SportFacility] = read_all_csvs(csv_folder)
+        self.df: pd.DataFrame = read_all_csvs_df(csv_folder)
         self.feature_name = feature_name
 
+        # Column arrays of the facilities for vectorized queries
+        # Writable copies, to_numpy returns read-only views under pandas copy-on-write
+        self._northing: np.ndarray = np.array(self.df["northing"], dtype=np.float64)
+        self._easting: np.ndarray = np.array(self.df["easting"], dtype=np.float64)
+        self._lat: np.ndarray = self.df["lat"].to_numpy(np.float64)
+        self._lon: np.ndarray = self.df["lon"].to_numpy(np.float64)
+        self._datasets = self.df["dataset"].to_numpy(object)
+        self._fac_names = self.df["fac_name"].to_numpy(object)
+        # Count the missing districts under None, as printed before
+        self._districts = self.df["district"].fillna("None").to_numpy(object)
+
+        # Sorted (items, occurences) of count_facility_by_x, keyed by the attribute name
+        self._counts_cache: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+        # k-d tree of the facility (x, y) points for nearest neighbour queries
+        self._tree = cKDTree(np.column_stack([self._easting, self._northing]))
+
+    @cached_property
+    def fac_list(self) -> list[SportFacility]:
+        """
+        The facilities as SportFacility objects, only built when a caller needs them.
+        """
+        return facilities_from_df(self.df)
+
     def point_to_feature_class(self):
         # Set the workspace for processing data
-        arcpy.env.workspace = self.workspace
-
-        # Allocate exact space for storing the points to avoid memory overhead
-        crs_point_geom: list = [None] * len(self.fac_list)
-
-        for index, facility in enumerate(self.fac_list):
-            temp_point = arcpy.Point(X=facility.easting, Y=facility.northing, ID=index)
-
-            geom = arcpy.PointGeometry(temp_point, spatial_reference=HK1980GRID)
-
-            crs_point_geom[index] = geom
+        _set_ws(self.workspace)
 
         print(f"The out feature name is `{self.feature_name}`")
-        arcpy.CopyFeatures_management(crs_point_geom, self.feature_name)
-        print("Successfully created a point feature class")
-
-    def add_attribute(self):
-        # Set the workspace for processing data
-        arcpy.env.workspace = self.workspace
-        (FieldManager(self.feature_name)
-         .add_field("GMID", "TEXT")
-         .add_field("Dataset", "TEXT")
-         .add_field("FacilityName", "TEXT")
-         .add_field("Address", "TEXT")
-         .add_field("District", "TEXT")
-         .add_field("Northing", "DOUBLE")
-         .add_field("Easting", "DOUBLE")
-         .add_field("Latitude", "DOUBLE")
-         .add_field("Longitude", "DOUBLE")
-         )
-
-        feature_table = arcpy.UpdateCursor(self.feature_name)
-        for row, facility in zip(feature_table, self.fac_list):
-            row.setValue("GMID", facility.gmid)
-            row.setValue("Dataset", facility.dataset)
-            row.setValue("FacilityName", facility.fac_name)
-            row.setValue("Address", facility.addr)
-            row.setValue("District", facility.district)
-            row.setValue("Northing", facility.northing)
-            row.setValue("Easting", facility.easting)
-            row.setValue("Latitude", facility.lat)
-            row.setValue("Longitude", facility.lon)
-            feature_table.updateRow(row)
+        self._facilities_to_feature_class(np.arange(len(self.df)), self.feature_name)
 
+        print("Successfully created a point feature class")
         print(f"Successfully added attributes for '{self.feature_name}'")
 
     # Compulsory Task
@@ -91,20 +133,45 @@ class FacilityFeature:
             location: (x, y) of the location
         """
         # Set the workspace for processing data
-        arcpy.env.workspace = self.workspace
+        _set_ws(self.workspace)
 
         loc_lat, loc_lon = location
 
-        # Create a point object and its geometry
-        point = arcpy.Point(X=loc_lon, Y=loc_lat, ID=1)
-        point_geom = arcpy.PointGeometry(point, spatial_reference=HK1980GRID)
+        # Query the k-d tree instead of running a spatial join for a single point
+        distance, index = self._tree.query([loc_lon, loc_lat], k=1)
 
-        arcpy.SpatialJoin_analysis(point_geom, self.feature_name, out_name,
-                                   join_operation="JOIN_ONE_TO_ONE",
-                                   match_option="CLOSEST_GEODESIC")
+        self._facilities_to_feature_class(np.array([index]), out_name)
         print(f"Successfully found the nearest facility to point ({loc_lat}, {loc_lon})")
+        print(f"{self._datasets[index]} in {self._fac_names[index]}, {distance:.1f} meters away")
         print(f"Saved as {out_name}\n")
 
+    def _facilities_to_feature_class(self, indices: np.ndarray, out_name: str):
+        """
+        Write the facilities into a new point feature class with all their attributes.
+
+        Args:
+            indices: the row indices of the facilities in df
+            out_name: the feature class name to be saved
+        """
+        facilities = self.df.iloc[indices]
+
+        # Fill the points and all their attributes column by column
+        array = np.empty(len(indices), dtype=FACILITY_DTYPE)
+        array["XY"][:, 0] = self._easting[indices]
+        array["XY"][:, 1] = self._northing[indices]
+        array["GMID"] = facilities["gmid"].to_numpy(object)
+        array["Dataset"] = self._datasets[indices]
+        array["FacilityName"] = self._fac_names[indices]
+        # Missing addresses and districts are written as empty strings
+        array["Address"] = facilities["addr"].fillna("").to_numpy(object)
+        array["District"] = facilities["district"].fillna("").to_numpy(object)
+        array["Northing"] = self._northing[indices]
+        array["Easting"] = self._easting[indices]
+        array["Latitude"] = self._lat[indices]
+        array["Longitude"] = self._lon[indices]
+
+        array_to_feature_class(array, out_name, HK1980GRID)
+
     # Extra questions
     def sport_fac_per_people_per_area(self):
         """
@@ -123,58 +190,58 @@ class FacilityFeature:
         )
 
         field_name = "fac_density"
-        arcpy.management.AddField(population_fc, field_name, "DOUBLE")
-
-        with arcpy.da.UpdateCursor(population_fc,
-                                   ["SHAPE@", "Y2025", "Shape_Area", field_name]) as cursor:
-            # Step 2: Iterate all the districts (shapes) in the shape file, reading its fields
-            for row in cursor:
-                # Skip if population or area is zero/null
-                shape, population, area_sqm, _ = row
-                if not all((population, area_sqm, population)):
-                    row[3] = 0
-                    cursor.updateRow(row)
-                    continue
-
-                # Step 3: Select the facilities contained by the shape
-                arcpy.management.SelectLayerByLocation(
-                    shape, "CONTAINS", self.feature_name
-                )
-
-                # Step 4: Count the facilities selected
-                facility_count = int(arcpy.management.GetCount(self.feature_name)[0])
-
-                # Step 5: Calculate density (facilities per 1000 people per sq km)
-                # Formula: (facilities / (population/1000)) / (area_sqm/sqm_to_sqkm)
-                area_sqkm = area_sqm / SQM_TO_SQKM
-                pop_per_thousand = population / 1000
-
-                if pop_per_thousand > 0 and area_sqkm > 0:
-                    density = (facility_count / pop_per_thousand) / area_sqkm
-                else:
-                    density = 0
-
-                row[3] = density
-                cursor.updateRow(row)
-
-        # Step 6: Rasterize the polygons
+
+        # Step 2: Index the facility points in memory, the districts only need to probe the tree
+        tree = shapely.STRtree(shapely.points(self._easting, self._northing))
+
+        # Step 3: Read all the districts (shapes) in the shape file, treating null fields as zero
+        with arcpy.da.SearchCursor(population_fc, ["OID@", "SHAPE@WKB", "Y2025", "Shape_Area"]) as cursor:
+            rows = list(cursor)
+        oids = np.array([row[0] for row in rows], dtype=np.int32)
+        # Parse all the shapes in one call, without materializing an arcpy Geometry per row
+        districts = shapely.from_wkb([bytes(row[1]) for row in rows])
+        populations = np.array([row[2] or 0 for row in rows], dtype=np.float64)
+        areas_sqm = np.array([row[3] or 0 for row in rows], dtype=np.float64)
+
+        # Step 4: Count the facilities contained by each shape, querying all the shapes in one call
+        hits = tree.query(districts, predicate="contains")
+        facility_counts = np.bincount(hits[0], minlength=len(districts))
+
+        # Step 5: Calculate density (facilities per 1000 people per sq km)
+        # Formula: (facilities / (population/1000)) / (area_sqm/sqm_to_sqkm)
+        area_sqkm = areas_sqm / SQM_TO_SQKM
+        pop_per_thousand = populations / 1000
+        # Skip if population or area is zero/null
+        valid = (pop_per_thousand > 0) & (area_sqkm > 0)
+        densities = np.zeros(len(rows), dtype=np.float64)
+        densities[valid] = (facility_counts[valid] / pop_per_thousand[valid]) / area_sqkm[valid]
+
+        # Step 6: Attach the densities to the districts in a single join on the OID
+        density_table = np.empty(len(rows), dtype=[("DistrictOID", "<i4"), (field_name, "<f8")])
+        density_table["DistrictOID"] = oids
+        density_table[field_name] = densities
+        arcpy.da.ExtendTable(population_fc, arcpy.Describe(population_fc).OIDFieldName,
+                             density_table, "DistrictOID")
+
+        # Step 7: Rasterize the polygons into memory
+        density_raster = r"memory\tmp_density"
         arcpy.conversion.PolygonToRaster(
             in_features=population_fc,
             value_field=field_name,
-            out_rasterdataset=output_name,
+            out_rasterdataset=density_raster,
             cell_assignment="CELL_CENTER",
             priority_field="NONE",
             cellsize=500
         )
 
-        # Step 7: High pass filter: >= 30 facilities per 1000 people per sq km
-        # Then save to file
-        filtered_raster = arcpy.sa.Con(arcpy.Raster(output_name) >= 30, arcpy.Raster(output_name))
-        filtered_raster.save(output_name + "_filtered")
+        # Step 8: High pass filter: >= 30 facilities per 1000 people per sq km
+        # Then save to file, the only raster written to the geodatabase
+        raster = arcpy.Raster(density_raster)
+        filtered_raster = arcpy.sa.SetNull(raster < 30, raster)
+        filtered_raster.save(output_name)
 
-        # Clean up (replace filtered with just output name)
-        arcpy.Delete_management(output_name)
-        arcpy.Rename_management(output_name + "_filtered", output_name)
+        # Clean up
+        arcpy.management.Delete(density_raster)
         print(f"Successfully saved bonus question to {output_name}\n")
 
     def filter_facility_within_radius(self, location: tuple[float, float], radius):
@@ -188,10 +255,13 @@ class FacilityFeature:
 
         print(f"Here are the facilities within {radius} meters of {location}:")
         northing, easting = location
-        for fac in self.fac_list:
-            if sqrt((fac.northing - northing) ** 2 + (fac.easting - easting) ** 2) < radius:
-                print(f"{fac.dataset} in {fac.fac_name}")
-        print()
+        # Compare the squared distances of all the facilities at once, no sqrt needed
+        within = _within_radius(self._northing, self._easting, northing, easting, radius)
+        indices = np.flatnonzero(within)
+        # Write all the matching lines at once instead of one print per facility
+        lines = [f"{dataset} in {fac_name}\n"
+                 for dataset, fac_name in zip(self._datasets[indices], self._fac_names[indices])]
+        sys.stdout.write("".join(lines) + "\n")
 
     def count_facility_by_district(self):
         self.count_facility_by_x("district")
@@ -209,35 +279,21 @@ class FacilityFeature:
         """
 
         print(f"Here are the facilities count by {attr}:")
-        # Get a list of tuples[item, occurence]
-        counts = list(Counter(getattr(fac, attr) for fac in self.fac_list).items())
+        if attr not in self._counts_cache:
+            # Get the unique items and their occurences from the column array, e.g. self._districts
+            fields, first_index, counts = np.unique(getattr(self, f"_{attr}s"),
+                                                    return_index=True, return_counts=True)
 
-        # Sort by occurences in descending order
-        counts.sort(key=lambda tup: tup[1], reverse=True)
+            # Sort by occurences in descending order, ties in the order they first appear
+            order = np.lexsort((first_index, -counts))
+            self._counts_cache[attr] = (fields[order], counts[order])
 
-        for field, count in counts:
+        for field, count in zip(*self._counts_cache[attr]):
             # Convert the integer representation back to a string
             print(f"{field}: {count}")
         print()
 
 
-class FieldManager:
-    def __init__(self, out_feature_name: str):
-        self.out_feature_name = out_feature_name
-
-    def add_field(self, field_name: str, field_type: str):
-        """
-        Add the fields to the feature class. Supports method chaining.
-        Args:
-            field_name: The new field name to be added
-            field_type: The data type of the field (e.g. TEXT, DOUBLE)
-        """
-
-        # Add multiple fields and types to the same feature name
-        arcpy.AddField_management(self.out_feature_name, field_name, field_type)
-        return self  # allows us to chain methods for readability
-
-
 def main():
     out_feature_name = "sport_facilities"
     polyu_block_z = (818630, 836500)
@@ -249,7 +305,6 @@ def main():
 
     # Compulsory
     facility_feature.point_to_feature_class()
-    facility_feature.add_attribute()
     facility_feature.nearest_facility("nearest_facility", polyu_block_z)
 
     # Bonus